@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 from __future__ import print_function
+import functools
 import json
 from re import A
 import shutil
@@ -17,19 +18,23 @@ from .__init__ import __version__
 from .paraviewer import paraviewer
 
 
+@functools.lru_cache(maxsize=None)
 def is_tool_installed(tool_name: str) -> bool:
-    if shutil.which(tool_name) is None:
-        return False
-    else:
-        return True
+    return shutil.which(tool_name) is not None
 
 
+@functools.lru_cache(maxsize=None)
 def is_tool_installed_via_conda(tool_name: str) -> bool:
-    is_tool_installed(tool_name)
+    if is_tool_installed(tool_name):
+        return True
     for conda_option in ["mamba", "conda", "micromamba"]:
+        if not is_tool_installed(conda_option):
+            continue
         try:
+            # conda accepts a regex filter, so only matching packages
+            # are listed and parsed rather than the whole environment
             result = subprocess.run(
-                [conda_option, "list", "--json"],
+                [conda_option, "list", "--json", f"^{tool_name}$"],
                 capture_output=True,
                 text=True,
                 check=True,
@@ -136,6 +141,12 @@ def setup_args():
         type=str,
         nargs="+",
     )
+    parser.add_argument(
+        "--num-threads",
+        help="Number of samples to process concurrently.",
+        type=int,
+        default=1,
+    )
     parser.add_argument(
         "--max-reads-per-haplotype",
         help="Maximum number of reads to show per haplotype.",
@@ -161,33 +172,31 @@ def validate_include_exclude_lists(
         include_list = []
     if exclude_list is None:
         exclude_list = []
+    exclude_set = set(exclude_list)
     for item in include_list:
-        if exclude_list and item in exclude_list:
+        if item in exclude_set:
             logger.error(f"{item} is in both include and exclude {list_name} lists")
             sys.exit(1)
     include_list = [item.lower() for item in include_list]
     exclude_list = [item.lower() for item in exclude_list]
 
     if valid_regions:
-        filtered_include_list = []
-        filtered_exclude_list = []
-        valid_regions = [x.lower() for x in valid_regions]
-        for i, include_item in enumerate(include_list):
-            if include_item in valid_regions:
-                filtered_include_list.append(include_item)
-            else:
-                logger.warning(
-                    f"Include list `{list_name}` contains invalid entry {include_item}, which will be ignored"
-                )
-
-        for i, exclude_item in enumerate(exclude_list):
-            if exclude_item in valid_regions:
-                filtered_exclude_list.append(exclude_item)
-            else:
-                logger.warning(
-                    f"Exclude list `{list_name}` contains invalid entry {exclude_item}, which will be ignored"
-                )
-        return filtered_include_list, filtered_exclude_list
+        valid_set = {x.lower() for x in valid_regions}
+
+        def filter_valid(items, label):
+            filtered = []
+            for item in items:
+                if item in valid_set:
+                    filtered.append(item)
+                else:
+                    logger.warning(
+                        f"{label} list `{list_name}` contains invalid entry {item}, which will be ignored"
+                    )
+            return filtered
+
+        return filter_valid(include_list, "Include"), filter_valid(
+            exclude_list, "Exclude"
+        )
     return include_list, exclude_list
 
 
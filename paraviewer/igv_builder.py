@@ -4,11 +4,16 @@
 Create IGV images and session files for display in web viewer
 """
 from __future__ import print_function
+import fcntl
 import subprocess
 import tempfile
 
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import logging
+from typing import Iterator
+import re
+import socket
 import sys
 import os
 import time
@@ -22,17 +27,20 @@ TIMEOUT_SECONDS = 1200
 BATCH_SIZE = 100
 
 """
-IGV automatically listens for localhost connections to port 60151.
-These allow it to accept socket connections and use them to define commands.
+IGV listens for localhost socket connections and accepts commands over
+them. The port is set per run through the preferences file rather than
+relying on IGV's default 60151, so the commands can only reach the IGV
+instance this run launched and never a desktop session or another
+paraviewer's IGV that already owns the default port.
 """
 IGV_HOST = "127.0.0.1"
-IGV_PORT = 60151
 IGV_MAX_WAIT = 60
 IGV_WAIT = 30
 IGV_VIRTUAL_SCREEN = "1920x1080x24"
 IGV_VIRTUAL_DISPLAY_NUMBER = 99
 IGV_GENOME_URL = "genome https://raw.githubusercontent.com/igvteam/igv-data/refs/heads/main/genomes/json/{}.json"
-VALID_GENOMES = ["hg38", "hg19"]
+VALID_GENOMES = frozenset(["hg38", "hg19"])
+VALID_CHROMOSOMES = frozenset(["{}".format(x) for x in range(1, 23)] + ["X", "Y"])
 
 IGVSessionFields = namedtuple(
     "IGVSessionFields", ["Genome", "Chrom", "Start", "End", "BAM", "BAI", "Sample"]
@@ -152,6 +160,45 @@ snapshot {}_{}.png
 """
 
 
+class CompiledSessionTemplate:
+    """
+    A session template split into its literal fragments and field names
+    once at import, so each per-region render is a simple join instead
+    of a full str.format re-parse of the ~3 KB template. The literal
+    fragments are also pre-encoded to UTF-8 so session files can be
+    written as bytes without re-encoding the full template per region.
+    """
+
+    def __init__(self, template):
+        chunks = re.split(r"\{0\.(\w+)\}", template)
+        self.literals = chunks[0::2]
+        self.field_names = chunks[1::2]
+        self.encoded_literals = [literal.encode("UTF-8") for literal in self.literals]
+
+    def render(self, session_fields):
+        parts = []
+        for literal, field_name in zip(self.literals, self.field_names):
+            parts.append(literal)
+            parts.append(str(getattr(session_fields, field_name)))
+        parts.append(self.literals[-1])
+        return "".join(parts)
+
+    def write(self, filehandle, session_fields):
+        """
+        Write the rendered session to a binary filehandle, only encoding
+        the interpolated field values.
+        """
+        for literal, field_name in zip(self.encoded_literals, self.field_names):
+            filehandle.write(literal)
+            filehandle.write(str(getattr(session_fields, field_name)).encode("UTF-8"))
+        filehandle.write(self.encoded_literals[-1])
+        filehandle.write(b"\n")
+
+
+COMPILED_SESSION_TEMPLATE = CompiledSessionTemplate(IGV_SESSION_TEMPLATE)
+COMPILED_TRIO_SESSION_TEMPLATE = CompiledSessionTemplate(TRIO_IGV_SESSION_TEMPLATE)
+
+
 def validate_IGV_session_fields(session_fields: IGVSessionFields):
     """
     Make sure that the IGV session fields are valid.
@@ -160,8 +207,7 @@ def validate_IGV_session_fields(session_fields: IGVSessionFields):
     if session_fields.Genome not in VALID_GENOMES:
         logger.error("Invalid genome build {}".format(session_fields.Genome))
         sys.exit(1)
-    valid_chromosomes = ["{}".format(x) for x in range(1, 23)] + ["X", "Y"]
-    if session_fields.Chrom.strip("chr") not in valid_chromosomes:
+    if session_fields.Chrom.removeprefix("chr") not in VALID_CHROMOSOMES:
         logger.error("Invalid chromosome {}".format(session_fields.Chrom))
         sys.exit(1)
     if type(session_fields.Start) is not int or type(session_fields.End) is not int:
@@ -177,45 +223,53 @@ def generate_igv_sessions(
     sample_region_entries: list[RegionEntry],
     outdir: str,
     genome: str,
-):
+) -> Iterator[str]:
     """
     * Create an IGV session file for each region in sample_region_entries.
     * Write the IGV session to outdir/data/sample/.
     * Write an IGV batch script section to generate the IGV snapshot from the session file.
-    * Return list of IGV batch strings
+    * Yield the IGV batch strings one at a time so the consumer can
+      stream them to batch files without materializing the full list.
     """
-    igv_batch_entries = []
     for region_entry in sample_region_entries:
-        if type(region_entry.BAM) != list:
+        is_trio_entry = isinstance(region_entry.BAM, list)
+        if is_trio_entry:
+            bam_basenames = [os.path.basename(bam) for bam in region_entry.BAM]
+            bai_basenames = [os.path.basename(bai) for bai in region_entry.BAI]
+        else:
+            bam_basenames = [os.path.basename(region_entry.BAM)]
+            bai_basenames = [os.path.basename(region_entry.BAI)]
+
+        if not is_trio_entry:
             session_info = IGVSessionFields(
                 genome,
                 region_entry.Chrom,
                 region_entry.Start,
                 region_entry.End,
-                os.path.basename(region_entry.BAM),
-                os.path.basename(region_entry.BAI),
+                bam_basenames[0],
+                bai_basenames[0],
                 region_entry.Sample,
             )
             validate_IGV_session_fields(session_info)
-            igv_session = IGV_SESSION_TEMPLATE.format(session_info)
+            session_template = COMPILED_SESSION_TEMPLATE
         elif len(region_entry.BAM) == 3:
             session_info = TrioIGVSessionFields(
                 Genome=genome,
                 Chrom=region_entry.Chrom,
                 Start=region_entry.Start,
                 End=region_entry.End,
-                PaternalBAM=os.path.basename(region_entry.BAM[0]),
-                PaternalBAI=os.path.basename(region_entry.BAI[0]),
-                MaternalBAM=os.path.basename(region_entry.BAM[1]),
-                MaternalBAI=os.path.basename(region_entry.BAI[1]),
-                BAM=os.path.basename(region_entry.BAM[2]),
-                BAI=os.path.basename(region_entry.BAI[2]),
+                PaternalBAM=bam_basenames[0],
+                PaternalBAI=bai_basenames[0],
+                MaternalBAM=bam_basenames[1],
+                MaternalBAI=bai_basenames[1],
+                BAM=bam_basenames[2],
+                BAI=bai_basenames[2],
                 Sample=region_entry.Sample,
                 PaternalID=region_entry.PaternalID,
                 MaternalID=region_entry.MaternalID,
             )
             validate_IGV_session_fields(session_info)
-            igv_session = TRIO_IGV_SESSION_TEMPLATE.format(session_info)
+            session_template = COMPILED_TRIO_SESSION_TEMPLATE
 
         # write one session file to the permanent location for later download
         igv_session_name = os.path.join(
@@ -223,27 +277,32 @@ def generate_igv_sessions(
             IGV_SESSIONS_PATH.format(sample=region_entry.Sample),
             f"{region_entry.Region}_igv.xml",
         )
-        with open(igv_session_name, "wt") as igv_out:
-            print(igv_session, file=igv_out)
+        with open(igv_session_name, "wb", buffering=1 << 16) as igv_out:
+            session_template.write(igv_out, session_info)
 
-        # write one session file to a temp location for immediate use
+        # link (or write) one session file to a temp location for immediate use
         tmp_igv_session_name = os.path.join(
             outdir,
             BAMS_PATH.format(sample=region_entry.Sample),
             f".{region_entry.Region}_igv.xml",
         )
-        with open(tmp_igv_session_name, "wt") as igv_out:
-            print(igv_session, file=igv_out)
+        try:
+            if os.path.exists(tmp_igv_session_name):
+                os.remove(tmp_igv_session_name)
+            os.link(igv_session_name, tmp_igv_session_name)
+        except OSError:
+            with open(tmp_igv_session_name, "wb", buffering=1 << 16) as igv_out:
+                session_template.write(igv_out, session_info)
 
         snapshot_directory = os.path.join(outdir, "data", region_entry.Sample, "images")
+
         igv_batch_entry = IGV_BATCH_TEMPLATE.format(
             tmp_igv_session_name,
             snapshot_directory,
             region_entry.Sample,
             region_entry.Region,
         )
-        igv_batch_entries.append(igv_batch_entry)
-    return igv_batch_entries
+        yield igv_batch_entry
 
 
 def write_prefs_file(outdir: str, is_trio: bool):
@@ -280,24 +339,67 @@ def run_batch_mac(batch_cmd, outdir):
         complete_process.check_returncode()
 
 
-def find_free_display(start, end):
-    for display_num in range(start, end + 10):
-        lock_file = f"/tmp/.X{display_num}-lock"
-        if not os.path.exists(lock_file):
+X_LOCK_DIR = "/tmp"
+DISPLAY_LOCK_FILENAME = ".paraviewer_display_lock"
+
+# displays handed out by this process that may not have an X lock file yet
+_reserved_displays = set()
+
+
+def find_free_display(start, end, lock_dir):
+    """
+    Find a free X display number in the requested range. A single
+    directory listing replaces one stat() per candidate display.
+    Selection is guarded by an in-process reservation set, so the
+    concurrent batch workers of one run can't pick the same display
+    before its Xvfb has registered an X lock file, plus an advisory
+    flock on a file under lock_dir (the run's output directory), which
+    additionally serializes any paraviewer processes sharing an outdir.
+    Displays claimed by unrelated X servers only become visible once
+    their /tmp/.X*-lock files exist.
+    """
+    lock_path = os.path.join(lock_dir, DISPLAY_LOCK_FILENAME)
+    # O_NOFOLLOW so a symlink planted at the lock path can't redirect
+    # the open; the fd is only ever flocked, never written
+    lock_fd = os.open(
+        lock_path, os.O_CREAT | os.O_WRONLY | os.O_NOFOLLOW, 0o600
+    )
+    try:
+        fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        x_locks = {
+            name
+            for name in os.listdir(X_LOCK_DIR)
+            if name.startswith(".X") and name.endswith("-lock")
+        }
+        for display_num in range(start, end + 10):
+            if display_num in _reserved_displays:
+                continue
+            if f".X{display_num}-lock" in x_locks:
+                continue
+            _reserved_displays.add(display_num)
             return display_num
+    finally:
+        # closing the descriptor also releases the flock
+        os.close(lock_fd)
     logger.error(f"No free X displays found (range: {start}-{end+10}).")
     sys.exit(1)
 
 
-def run_batch_linux(batch_cmd, outdir, batch_count):
+def release_display(display_num):
+    """
+    Return a display number reserved by find_free_display to the pool.
+    """
+    _reserved_displays.discard(display_num)
+
+
+def run_batch_linux(batch_cmd, outdir, virtual_display_num):
     """
     Deploy IGV in headless mode with Xvfb to generate
-    images using the given commands.
+    images using the given commands. The caller must supply
+    a free X display number, so concurrent invocations each
+    get their own Xvfb instance.
     """
     # Start Xvfb
-    virtual_display_num = find_free_display(
-        IGV_VIRTUAL_DISPLAY_NUMBER, IGV_VIRTUAL_DISPLAY_NUMBER + batch_count
-    )
     xvfb = subprocess.Popen(
         ["Xvfb", f":{virtual_display_num}", "-screen", "0", IGV_VIRTUAL_SCREEN]
     )
@@ -322,6 +424,103 @@ def run_batch_linux(batch_cmd, outdir, batch_count):
         # Ensure Xvfb is always terminated, regardless of success or failure
         xvfb.terminate()
         xvfb.wait()  # Wait for the process to actually terminate
+        release_display(virtual_display_num)
+
+
+def choose_free_port():
+    """
+    Ask the kernel for a currently free localhost port to assign to the
+    IGV instance this run launches.
+    """
+    with socket.socket() as probe:
+        probe.bind((IGV_HOST, 0))
+        return probe.getsockname()[1]
+
+
+def connect_to_igv(igv_port):
+    """
+    Poll the IGV socket port until IGV accepts the connection
+    or IGV_MAX_WAIT seconds have passed. Returns the connected
+    socket, or None if IGV never came up.
+    """
+    deadline = time.monotonic() + IGV_MAX_WAIT
+    while time.monotonic() < deadline:
+        try:
+            return socket.create_connection((IGV_HOST, igv_port), timeout=1)
+        except OSError:
+            time.sleep(1)
+    return None
+
+
+def run_batches_via_socket(batch_filenames, outdir, preferences_file):
+    """
+    Launch a single IGV instance and stream the batch commands to it
+    over the localhost socket port that IGV listens on, so the JVM
+    startup and genome load are paid once instead of once per batch.
+    Returns True on success, False if IGV could not be driven this way
+    (in which case the caller should fall back to one process per batch).
+    """
+    # bind IGV to a port chosen for this run via its preferences file;
+    # connecting to the default 60151 could silently attach to some
+    # other IGV instance and replay the batch against it
+    igv_port = choose_free_port()
+    with open(preferences_file, "a") as prefs_fh:
+        print("PORT_ENABLED=true", file=prefs_fh)
+        print(f"PORT_NUMBER={igv_port}", file=prefs_fh)
+
+    xvfb = None
+    env = os.environ.copy()
+    if is_linux():
+        virtual_display_num = find_free_display(
+            IGV_VIRTUAL_DISPLAY_NUMBER, IGV_VIRTUAL_DISPLAY_NUMBER + 1, outdir
+        )
+        xvfb = subprocess.Popen(
+            ["Xvfb", f":{virtual_display_num}", "-screen", "0", IGV_VIRTUAL_SCREEN]
+        )
+        time.sleep(1)  # Give Xvfb time to initialize
+        env["DISPLAY"] = f":{virtual_display_num}"
+
+    try:
+        with open(os.path.join(outdir, "igv.log"), "a") as igv_log:
+            igv = subprocess.Popen(
+                ["igv", "--preferences", preferences_file],
+                env=env,
+                stdout=igv_log,
+                stderr=igv_log,
+            )
+            try:
+                sock = connect_to_igv(igv_port)
+                if sock is None:
+                    logger.warning(
+                        "IGV did not accept a socket connection on port {}".format(
+                            igv_port
+                        )
+                    )
+                    return False
+                sock.settimeout(TIMEOUT_SECONDS)
+                with sock, sock.makefile("r") as ack:
+                    for batch_filename in batch_filenames:
+                        with open(batch_filename, "r") as batch_fh:
+                            for command in batch_fh:
+                                command = command.strip()
+                                # skip blanks and per-batch exits so the
+                                # IGV instance persists across batches
+                                if not command or command == "exit":
+                                    continue
+                                sock.sendall(command.encode() + b"\n")
+                                ack.readline()
+                    sock.sendall(b"exit\n")
+                igv.wait(timeout=IGV_MAX_WAIT)
+            finally:
+                if igv.poll() is None:
+                    igv.terminate()
+                    igv.wait()
+    finally:
+        if xvfb is not None:
+            xvfb.terminate()
+            xvfb.wait()
+            release_display(virtual_display_num)
+    return True
 
 
 def write_batch_scripts(outdir, genome, igv_batch_entries):
@@ -366,28 +565,71 @@ def generate_igv_images(igv_batch_entries, outdir, genome, is_trio):
         )
         sys.exit(1)
 
-    if len(igv_batch_entries) == 0:
-        logger.error("No valid regions for IGV batch image generation")
-        sys.exit(1)
-
     batch_filenames = write_batch_scripts(outdir, genome, igv_batch_entries)
+    if len(batch_filenames) == 0:
+        # legitimate, e.g. for the trio pass of a run with no trios
+        logger.info("No regions require IGV batch image generation")
+        return
     preferences_file = write_prefs_file(outdir, is_trio)
 
-    for batch_filename in batch_filenames:
-        cmd = [
+    # preferred path: one persistent IGV driven over its socket port
+    try:
+        succeeded = run_batches_via_socket(batch_filenames, outdir, preferences_file)
+    except Exception as err:
+        logger.warning("IGV socket run failed:\n{}".format(err))
+        succeeded = False
+    if succeeded:
+        for batch_filename in batch_filenames:
+            os.remove(batch_filename)
+        return
+    logger.warning("Falling back to one IGV process per batch file")
+
+    batch_cmds = [
+        [
             "igv",
             "-b",
             batch_filename,
             "--preferences",
             preferences_file,
         ]
+        for batch_filename in batch_filenames
+    ]
 
-        try:
-            if is_mac():
+    if is_mac():
+        # only one GUI IGV instance can run at a time on mac
+        for batch_filename, cmd in zip(batch_filenames, batch_cmds):
+            try:
                 run_batch_mac(cmd, outdir)
-            elif is_linux():
-                run_batch_linux(cmd, outdir, len(batch_filename))
-        except Exception as err:
-            logger.error("IGV batch failed:\n{}\n{}".format(batch_filename, err))
-        finally:
-            os.remove(batch_filename)
+            except Exception as err:
+                logger.error("IGV batch failed:\n{}\n{}".format(batch_filename, err))
+            finally:
+                os.remove(batch_filename)
+        return
+
+    # on linux each batch gets its own Xvfb display,
+    # so the batches can run concurrently
+    display_nums = []
+    next_display = IGV_VIRTUAL_DISPLAY_NUMBER
+    for _ in batch_filenames:
+        display_num = find_free_display(
+            next_display, next_display + len(batch_filenames), outdir
+        )
+        display_nums.append(display_num)
+        next_display = display_num + 1
+
+    max_workers = min(len(batch_filenames), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(run_batch_linux, cmd, outdir, display_num): batch_filename
+            for batch_filename, cmd, display_num in zip(
+                batch_filenames, batch_cmds, display_nums
+            )
+        }
+        for future in as_completed(futures):
+            batch_filename = futures[future]
+            try:
+                future.result()
+            except Exception as err:
+                logger.error("IGV batch failed:\n{}\n{}".format(batch_filename, err))
+            finally:
+                os.remove(batch_filename)
@@ -5,17 +5,73 @@ Create HTML viewer for Paraphase genomic variant results.
 """
 from __future__ import print_function
 
+import functools
 import logging
 import os
+from dataclasses import asdict
+from operator import attrgetter
 import sys
+import threading
 from .__init__ import __version__
 
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+from jinja2 import (
+    Environment,
+    FileSystemBytecodeCache,
+    FileSystemLoader,
+    select_autoescape,
+)
 import shutil
 from .utils import RegionEntry
 
 logger = logging.getLogger(__name__)
 
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), "templates")
+
+_env = None
+_env_lock = threading.Lock()
+
+
+def _get_environment():
+    """
+    Build the Jinja environment once per process, with a filesystem
+    bytecode cache so repeat runs skip template lexing/parsing.
+    """
+    global _env
+    with _env_lock:
+        if _env is None:
+            bytecode_cache = None
+            try:
+                # no explicit directory: Jinja creates a per-user cache
+                # dir with ownership checks, so cache entries (loaded via
+                # marshal) can't be planted by another local user
+                bytecode_cache = FileSystemBytecodeCache()
+            except (OSError, RuntimeError):
+                logger.debug("Could not create Jinja bytecode cache directory")
+            _env = Environment(
+                loader=FileSystemLoader(TEMPLATE_DIR),
+                autoescape=select_autoescape(["html"]),
+                bytecode_cache=bytecode_cache,
+            )
+        return _env
+
+
+@functools.lru_cache(maxsize=None)
+def _get_template(template_name):
+    return _get_environment().get_template(template_name)
+
+
+def _fast_copy(src, dst):
+    """
+    Hardlink a file when source and destination share a filesystem,
+    falling back to a regular copy when linking isn't possible.
+    """
+    try:
+        if os.path.exists(dst):
+            os.remove(dst)
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
 
 def write_site(table_data, out_dir):
     """
@@ -26,14 +82,8 @@ def write_site(table_data, out_dir):
         out_dir: Output directory path
     """
     # grab the template
-    template_dir = os.path.join(os.path.dirname(__file__), "templates")
-    env = Environment(
-        loader=FileSystemLoader(template_dir),
-        autoescape=select_autoescape(["html"]),
-    )
-
     try:
-        html_template = env.get_template("paraviewer.html")
+        html_template = _get_template("paraviewer.html")
     except Exception as e:
         logger.error(f"Failed to load template: {e}")
         sys.exit(1)
@@ -45,25 +95,23 @@ def write_site(table_data, out_dir):
         "js",
         "stylesheets",
     ]:
-        src = os.path.join(template_dir, "static", filename)
+        src = os.path.join(TEMPLATE_DIR, "static", filename)
         destination = os.path.join(out_dir, filename)
 
         if os.path.isfile(src):
-            shutil.copy2(src, destination)
+            _fast_copy(src, destination)
         elif os.path.isdir(src):
-            shutil.copytree(src, destination, dirs_exist_ok=True)
+            shutil.copytree(
+                src, destination, copy_function=_fast_copy, dirs_exist_ok=True
+            )
         else:
             logger.error("Failed to copy static template files to outdir")
             sys.exit(1)
 
-    # write index.html
+    # write index.html, streaming chunks rather than
+    # materializing the whole rendered page in memory
     with open("{out_dir}/index.html".format(out_dir=out_dir), "w") as fh:
-        print(
-            html_template.render(
-                data=table_data,
-            ),
-            file=fh,
-        )
+        html_template.stream(data=table_data).dump(fh)
 
 
 def generate_table(sample_entries: list[RegionEntry]):
@@ -76,32 +124,17 @@ def generate_table(sample_entries: list[RegionEntry]):
     Returns:
         Dictionary containing table data and column visibility flags
     """
-    table_data = []
+    # Check each pedigree field independently, stopping at the first hit
     has_pedigree_columns = {
-        "FamilyID": False,
-        "PaternalID": False,
-        "MaternalID": False,
-        "Sex": False,
-        "Phenotype": False,
+        field: any(getattr(entry, field) for entry in sample_entries)
+        for field in ("FamilyID", "PaternalID", "MaternalID", "Sex", "Phenotype")
     }
 
-    for entry in sample_entries:
-        # Check each pedigree field independently
-        if entry.FamilyID:
-            has_pedigree_columns["FamilyID"] = True
-        if entry.PaternalID:
-            has_pedigree_columns["PaternalID"] = True
-        if entry.MaternalID:
-            has_pedigree_columns["MaternalID"] = True
-        if entry.Sex:
-            has_pedigree_columns["Sex"] = True
-        if entry.Phenotype:
-            has_pedigree_columns["Phenotype"] = True
-
-        table_data.append(entry._asdict())
-
-    # Sort by chromosome, start position, and end position
-    table_data.sort(key=lambda x: (x["Chrom"], x["Start"], x["End"]))
+    # Sort by chromosome, start position, and end position.
+    # Sorting the entries first means the row dicts are only
+    # materialized once, in final order.
+    entries_sorted = sorted(sample_entries, key=attrgetter("Chrom", "Start", "End"))
+    table_data = [asdict(entry) for entry in entries_sorted]
 
     return {"table_data": table_data, "has_pedigree_columns": has_pedigree_columns}
 
@@ -16,8 +16,10 @@ from paraviewer.utils import (
     get_config,
     make_output_dirs,
     split_bam,
+    unpack_json,
 )
 from . import __version__
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import sys
 from typing import Dict, List, Optional
 from tqdm import tqdm
@@ -33,16 +35,15 @@ def get_trio_samples(
     """
     Get the trio samples from the pedigree dictionary and the paraphase results
     """
-    trio_samples = {}
-    for sample in pedigree_dict:
-        if sample in all_paraphase_results:
-            pedigree_entry = pedigree_dict[sample]
-            if (
-                pedigree_entry.PaternalID in all_paraphase_results
-                and pedigree_entry.MaternalID in all_paraphase_results
-            ):
-                trio_samples[f"{sample}-trio"] = pedigree_entry
-    return trio_samples
+    return {
+        f"{sample}-trio": pedigree_entry
+        for sample, pedigree_entry in pedigree_dict.items()
+        if sample in all_paraphase_results
+        and pedigree_entry.PaternalID
+        and pedigree_entry.MaternalID
+        and pedigree_entry.PaternalID in all_paraphase_results
+        and pedigree_entry.MaternalID in all_paraphase_results
+    }
 
 
 def read_pedigree_file(
@@ -62,6 +63,8 @@ def read_pedigree_file(
     if not ped_file or not path.exists(ped_file):
         return {}
 
+    include_set = frozenset(s.lower() for s in include_only_samples)
+    exclude_set = frozenset(s.lower() for s in exclude_samples)
     pedigree_dict = {}
     try:
         with open(ped_file, "r") as f:
@@ -78,12 +81,10 @@ def read_pedigree_file(
                 family_id, individual_id, PaternalID, MaternalID, sex, phenotype = (
                     fields
                 )
-                if (
-                    len(include_only_samples) > 0
-                    and individual_id.lower() not in include_only_samples
-                ):
+                individual_id_lower = individual_id.lower()
+                if include_set and individual_id_lower not in include_set:
                     continue
-                if individual_id.lower() in exclude_samples:
+                if individual_id_lower in exclude_set:
                     continue
 
                 # Convert empty values to empty strings
@@ -125,7 +126,8 @@ def process_individual_sample(
     exclude_regions,
     genome,
     max_reads_per_hap,
-    no_igv_rerun,
+    parsed_json=None,
+    num_threads=1,
 ):
     """
     Process an individual sample and return the region entries
@@ -136,7 +138,8 @@ def process_individual_sample(
         paraphase_config: Dictionary mapping region names to config information
 
     Returns:
-        List of RegionEntry namedtuples
+        List of RegionEntry namedtuples, split BAM paths by region, and the
+        IGV batch entries for this sample (rendered later in one IGV run)
     """
     make_output_dirs(outdir, sample_paraphase_results.Sample, clobber)
     split_bams = split_bam(
@@ -147,6 +150,7 @@ def process_individual_sample(
         include_only_regions,
         exclude_regions,
         max_reads_per_hap,
+        num_threads,
     )
     if len(split_bams) == 0:
         logger.error(f"No specified regions found in {sample_paraphase_results.BAM}.")
@@ -157,12 +161,13 @@ def process_individual_sample(
         pedigree_dict.get(sample_paraphase_results.Sample),
         split_bams,
         paraphase_config,
+        parsed_json,
     )
 
-    igv_batch_entries = generate_igv_sessions(sample_region_entries, outdir, genome)
-    if not no_igv_rerun:
-        generate_igv_images(igv_batch_entries, outdir, genome, False)
-    return sample_region_entries, split_bams
+    # consuming the generator writes the session files; the batch
+    # entries are rendered in a single IGV run across all samples
+    igv_batch_entries = list(generate_igv_sessions(sample_region_entries, outdir, genome))
+    return sample_region_entries, split_bams, igv_batch_entries
 
 
 def process_trio(
@@ -173,10 +178,11 @@ def process_trio(
     outdir,
     clobber,
     genome,
-    no_igv_rerun,
+    parsed_json=None,
 ):
     """
     Process a trio sample and return the region entries
+    and the trio's IGV batch entries
     """
     make_output_dirs(outdir, trio.IndividualID + "-trio", clobber)
 
@@ -188,12 +194,11 @@ def process_trio(
         all_split_bams,
         paraphase_config,
         outdir,
+        parsed_json,
     )
 
-    igv_batch_entries = generate_igv_sessions(trio_region_entries, outdir, genome)
-    if not no_igv_rerun:
-        generate_igv_images(igv_batch_entries, outdir, genome, True)
-    return trio_region_entries
+    igv_batch_entries = list(generate_igv_sessions(trio_region_entries, outdir, genome))
+    return trio_region_entries, igv_batch_entries
 
 
 def paraviewer(args):
@@ -226,39 +231,94 @@ def paraviewer(args):
 
     trio_samples = get_trio_samples(pedigree_dict, all_paraphase_results)
 
-    for i, sample in enumerate(
-        tqdm(
-            list(all_paraphase_results.keys()) + list(trio_samples.keys()),
-            desc="Samples processed",
+    # parse every sample's JSON up front, overlapping file reads and
+    # gzip decompression across threads
+    with ThreadPoolExecutor(
+        max_workers=min(len(all_paraphase_results), max(args.num_threads, 8))
+    ) as executor:
+        parsed_json_by_sample = dict(
+            zip(
+                all_paraphase_results,
+                executor.map(
+                    unpack_json,
+                    (results.JSON for results in all_paraphase_results.values()),
+                ),
+            )
         )
-    ):
-        if i < len(all_paraphase_results):
+
+    # per-sample work is independent, so samples can be dispatched to a
+    # process pool; trios run afterwards since they need all_split_bams
+    num_threads = args.num_threads if args.num_threads else 1
+    use_process_pool = num_threads > 1 and len(all_paraphase_results) > 1
+    # when samples run in parallel the cores are already busy, so BAM
+    # decompression stays single-threaded within each worker process
+    decode_threads = 1 if use_process_pool else num_threads
+    sample_task_args = {
+        sample: (
+            sample_paraphase_results,
+            pedigree_dict,
+            paraphase_config,
+            args.outdir,
+            args.clobber,
+            args.include_only_regions,
+            args.exclude_regions,
+            args.genome,
+            args.max_reads_per_haplotype,
+            parsed_json_by_sample.get(sample),
+            decode_threads,
+        )
+        for sample, sample_paraphase_results in all_paraphase_results.items()
+    }
+    sample_igv_batch_entries = []
+    trio_igv_batch_entries = []
+    if use_process_pool:
+        with ProcessPoolExecutor(max_workers=num_threads) as executor:
+            futures = {
+                executor.submit(process_individual_sample, *task_args): sample
+                for sample, task_args in sample_task_args.items()
+            }
+            for future in tqdm(
+                as_completed(futures),
+                total=len(futures),
+                desc="Samples processed",
+            ):
+                sample = futures[future]
+                sample_region_entries, sample_split_bams, igv_batch_entries = (
+                    future.result()
+                )
+                all_region_entries += sample_region_entries
+                all_split_bams[sample] = sample_split_bams
+                sample_igv_batch_entries += igv_batch_entries
+    else:
+        for sample, task_args in tqdm(
+            sample_task_args.items(), desc="Samples processed"
+        ):
             logger.info(f"Processing sample {sample}")
-            sample_paraphase_results = all_paraphase_results[sample]
-            sample_region_entries, sample_split_bams = process_individual_sample(
-                sample_paraphase_results,
-                pedigree_dict,
-                paraphase_config,
-                args.outdir,
-                args.clobber,
-                args.include_only_regions,
-                args.exclude_regions,
-                args.genome,
-                args.max_reads_per_haplotype,
-                args.no_igv_rerun,
+            sample_region_entries, sample_split_bams, igv_batch_entries = (
+                process_individual_sample(*task_args)
             )
             all_region_entries += sample_region_entries
             all_split_bams[sample] = sample_split_bams
-        else:
-            logger.info(f"Processing trio {sample}")
-            all_region_entries += process_trio(
-                trio_samples[sample],
-                all_paraphase_results,
-                all_split_bams,
-                paraphase_config,
-                args.outdir,
-                args.clobber,
-                args.genome,
-                args.no_igv_rerun,
-            )
+            sample_igv_batch_entries += igv_batch_entries
+
+    for trio_name, trio in tqdm(trio_samples.items(), desc="Trios processed"):
+        logger.info(f"Processing trio {trio_name}")
+        trio_region_entries, igv_batch_entries = process_trio(
+            trio,
+            all_paraphase_results,
+            all_split_bams,
+            paraphase_config,
+            args.outdir,
+            args.clobber,
+            args.genome,
+            parsed_json_by_sample,
+        )
+        all_region_entries += trio_region_entries
+        trio_igv_batch_entries += igv_batch_entries
+
+    # render all snapshots in one IGV invocation per layout, so the JVM
+    # and genome-load startup cost is paid once instead of per sample
+    if not args.no_igv_rerun:
+        generate_igv_images(sample_igv_batch_entries, args.outdir, args.genome, False)
+        generate_igv_images(trio_igv_batch_entries, args.outdir, args.genome, True)
     build_review_page(args.outdir, all_region_entries)
@@ -1,6 +1,5 @@
-from glob import glob
 import logging
-from os import path
+from os import path, scandir
 from typing import Dict, Optional
 from paraviewer.special_info import get_special_info
 from paraviewer.utils import (
@@ -24,7 +23,7 @@ def get_paraphase_results(
     include_only_samples: list[str],
     exclude_samples: list[str],
     pedigree_dict: Dict[str, PedigreeEntry],
-):
+) -> Dict[str, ParaphaseResults]:
     """
     Validates that expected result files are where
     they should be and returns their paths. For each included sample, should find:
@@ -32,36 +31,59 @@ def get_paraphase_results(
     * BAI
     * JSON(.GZ)
 
-    Returns list[ParaphaseResults]
+    Returns dict of ParaphaseResults by sample ID
     """
     all_results = {}
-    # check JSON file
-    json_matches = glob(path.join(paraphase_dir, "*paraphase.json")) + glob(
-        path.join(paraphase_dir, "*paraphase.json.gz")
-    )
-    if not json_matches or len(json_matches) < 1:
+    include_set = frozenset(s.lower() for s in include_only_samples)
+    exclude_set = frozenset(s.lower() for s in exclude_samples)
+    # one directory scan classifies the JSONs and collects the file
+    # names, so the later BAM/BAI checks don't need per-file stats.
+    # Unwanted samples are dropped here, before any further work,
+    # so a small include list skips most of a large cohort directory
+    json_matches = []
+    result_file_names = set()
+    found_any_json = False
+    try:
+        with scandir(paraphase_dir) as dir_entries:
+            for dir_entry in dir_entries:
+                if not dir_entry.is_file():
+                    continue
+                result_file_names.add(dir_entry.name)
+                if not (
+                    dir_entry.name.endswith("paraphase.json")
+                    or dir_entry.name.endswith("paraphase.json.gz")
+                ):
+                    continue
+                found_any_json = True
+                sample = parse_sample_name_from_paraphase_output(dir_entry.name)
+                sample_lower = sample.lower()
+                if include_set and sample_lower not in include_set:
+                    continue
+                if sample_lower in exclude_set:
+                    continue
+                json_matches.append((dir_entry.path, sample))
+    except FileNotFoundError:
+        pass
+    if not found_any_json:
         logger.warning("No JSON result file found in {}".format(paraphase_dir))
-        return
-    for json_filename in json_matches:
-        sample = parse_sample_name_from_paraphase_output(json_filename)
-        if len(include_only_samples) > 0 and sample.lower() not in include_only_samples:
-            continue
-        if sample.lower() in exclude_samples:
-            continue
+        return {}
+    for json_filename, sample in json_matches:
         if len(pedigree_dict) > 0 and sample not in pedigree_dict:
             continue
 
         # check BAM file
-        bam_name = path.join(paraphase_dir, "{}.paraphase.bam".format(sample))
-        if not path.isfile(bam_name):
+        bam_base = f"{sample}.paraphase.bam"
+        if bam_base not in result_file_names:
             logger.warning("No BAM result file found in {}".format(paraphase_dir))
             continue
+        bam_name = path.join(paraphase_dir, bam_base)
 
         # check BAI file
-        bai_name = path.join(paraphase_dir, "{}.paraphase.bam.bai".format(sample))
-        if not path.isfile(bai_name):
+        bai_base = f"{sample}.paraphase.bam.bai"
+        if bai_base not in result_file_names:
             logger.warning("No BAM index file found in {}".format(paraphase_dir))
             continue
+        bai_name = path.join(paraphase_dir, bai_base)
 
         all_results[sample] = ParaphaseResults(
             Sample=sample,
@@ -85,11 +107,16 @@ def make_trio_table_entries(
     all_split_bams: Dict[str, str],
     paraphase_config: Dict[str, Dict],
     outdir: str,
+    parsed_json: Optional[Dict[str, Dict]] = None,
 ):
     """
     Reads the info that will be used for page building from trio paraphase jsons
     and creates namedtuples for the table rows.
 
+    Args:
+        parsed_json: Optional pre-parsed JSON calls keyed by sample ID,
+            used to skip re-reading the trio members' JSON files
+
     Returns:
         List of RegionEntry namedtuples
     """
@@ -99,11 +126,23 @@ def make_trio_table_entries(
         or trio.MaternalID not in all_split_bams
     ):
         return []
-    proband_paraphase_json_calls = unpack_json(proband_paraphase_results.JSON)
-    paternal_paraphase_json_calls = unpack_json(paternal_paraphase_results.JSON)
-    maternal_paraphase_json_calls = unpack_json(maternal_paraphase_results.JSON)
+    if parsed_json is None:
+        parsed_json = {}
+    proband_paraphase_json_calls = parsed_json.get(trio.IndividualID) or unpack_json(
+        proband_paraphase_results.JSON
+    )
+    paternal_paraphase_json_calls = parsed_json.get(trio.PaternalID) or unpack_json(
+        paternal_paraphase_results.JSON
+    )
+    maternal_paraphase_json_calls = parsed_json.get(trio.MaternalID) or unpack_json(
+        maternal_paraphase_results.JSON
+    )
 
     trio_entries = []
+    # the sample-level output directories are loop invariants
+    trio_sample = trio.IndividualID + "-trio"
+    igv_sessions_dir = IGV_SESSIONS_PATH.format(sample=trio_sample)
+    images_dir = IMAGES_PATH.format(sample=trio_sample)
     for region in proband_paraphase_json_calls:
         proband_region_data = proband_paraphase_json_calls[region]
         paternal_region_data = paternal_paraphase_json_calls[region]
@@ -116,7 +155,7 @@ def make_trio_table_entries(
         ):
             continue
 
-        bam_paths = copy_trio_bams(
+        bam_paths, bai_paths = copy_trio_bams(
             trio,
             region,
             outdir,
@@ -139,14 +178,8 @@ def make_trio_table_entries(
             region, proband_region_data, proband_paraphase_results
         )
 
-        igv_session_path = path.join(
-            IGV_SESSIONS_PATH.format(sample=trio.IndividualID + "-trio"),
-            f"{region}_igv.xml",
-        )
-        image_path = path.join(
-            IMAGES_PATH.format(sample=trio.IndividualID + "-trio"),
-            f"{trio.IndividualID + "-trio"}_{region}.png",
-        )
+        igv_session_path = path.join(igv_sessions_dir, f"{region}_igv.xml")
+        image_path = path.join(images_dir, f"{trio_sample}_{region}.png")
 
         trio_entries.append(
             RegionEntry(
@@ -154,9 +187,9 @@ def make_trio_table_entries(
                 max(0, realign_region.Start - REGION_PADDING),
                 max(0, realign_region.End + REGION_PADDING),
                 region,
-                trio.IndividualID + "-trio",
+                trio_sample,
                 bam_paths,
-                [x + ".bai" for x in bam_paths],
+                bai_paths,
                 total_cn,
                 special_info,
                 image_path,
@@ -176,6 +209,7 @@ def make_table_entries(
     pedigree_entry: Optional[PedigreeEntry],
     split_bams: Dict[str, str],
     paraphase_config: Dict[str, Dict],
+    parsed_json: Optional[Dict] = None,
 ):
     """
     Reads the info that will be used for page building from a json file
@@ -185,13 +219,28 @@ def make_table_entries(
         ParaphaseResults namedtuple
         genome_build: Genome build to use
         pedigree_entry: Optional PedigreeEntry for this sample
+        parsed_json: Optional pre-parsed JSON calls for this sample
 
     Returns:
         List of RegionEntry namedtuples
     """
-    paraphase_json_calls = unpack_json(paraphase_results.JSON)
+    paraphase_json_calls = (
+        parsed_json if parsed_json is not None else unpack_json(paraphase_results.JSON)
+    )
 
     sample_entries = []
+    # the sample-level output directories and pedigree fields are loop invariants
+    sample = paraphase_results.Sample
+    igv_sessions_dir = IGV_SESSIONS_PATH.format(sample=sample)
+    images_dir = IMAGES_PATH.format(sample=sample)
+    if pedigree_entry:
+        family_id = pedigree_entry.FamilyID
+        paternal_id = pedigree_entry.PaternalID
+        maternal_id = pedigree_entry.MaternalID
+        sex = pedigree_entry.Sex
+        phenotype = pedigree_entry.Phenotype
+    else:
+        family_id = paternal_id = maternal_id = sex = phenotype = ""
     for region in paraphase_json_calls:
         region_data = paraphase_json_calls[region]
         if region not in split_bams:
@@ -213,14 +262,8 @@ def make_table_entries(
             region, region_data, paraphase_results
         )
 
-        igv_session_path = path.join(
-            IGV_SESSIONS_PATH.format(sample=paraphase_results.Sample),
-            f"{region}_igv.xml",
-        )
-        image_path = path.join(
-            IMAGES_PATH.format(sample=paraphase_results.Sample),
-            f"{paraphase_results.Sample}_{region}.png",
-        )
+        igv_session_path = path.join(igv_sessions_dir, f"{region}_igv.xml")
+        image_path = path.join(images_dir, f"{sample}_{region}.png")
 
         sample_entries.append(
             RegionEntry(
@@ -228,18 +271,18 @@ def make_table_entries(
                 max(0, realign_region.Start - REGION_PADDING),
                 max(0, realign_region.End + REGION_PADDING),
                 region,
-                paraphase_results.Sample,
+                sample,
                 bam_path,
                 bai_path,
                 total_cn,
                 special_info,
                 image_path,
                 igv_session_path,
-                pedigree_entry.FamilyID if pedigree_entry else "",
-                pedigree_entry.PaternalID if pedigree_entry else "",
-                pedigree_entry.MaternalID if pedigree_entry else "",
-                pedigree_entry.Sex if pedigree_entry else "",
-                pedigree_entry.Phenotype if pedigree_entry else "",
+                family_id,
+                paternal_id,
+                maternal_id,
+                sex,
+                phenotype,
             )
         )
     return sample_entries
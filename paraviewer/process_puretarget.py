@@ -1,6 +1,7 @@
+from dataclasses import replace
 from glob import glob
 import logging
-from os import path
+from os import path, scandir
 from typing import Dict
 from paraviewer.process_paraphase import get_paraphase_results
 from paraviewer.utils import (
@@ -31,7 +32,13 @@ def get_puretarget_results(
     """
     all_results = {}
     for paraphase_dir in glob(path.join(puretarget_dir, "*_paraphase")):
-        output_file = glob(path.join(paraphase_dir, "*"))[0]
+        # any single output file is enough to parse the sample name,
+        # so grab the first directory entry instead of globbing them all
+        try:
+            with scandir(paraphase_dir) as dir_entries:
+                output_file = next(dir_entries).path
+        except StopIteration:
+            continue
         sample = parse_sample_name_from_paraphase_output(output_file)
         sample_results = get_paraphase_results(
             paraphase_dir, include_only_samples, exclude_samples, pedigree_dict
@@ -41,12 +48,12 @@ def get_puretarget_results(
         base_dirname = strip_suffix_from_path(paraphase_dir, "_paraphase")
         f8_json_path = base_dirname + ".f8inversion.json"
         f8_special_info = get_f8_inv_annotation(f8_json_path)
-        sample_results[sample] = sample_results[sample]._replace(F8_INV=f8_special_info)
+        sample_results[sample] = replace(sample_results[sample], F8_INV=f8_special_info)
 
         havanno_json_path = base_dirname + ".havanno.json"
         havanno_special_info = get_havanno_annotations(havanno_json_path)
-        sample_results[sample] = sample_results[sample]._replace(
-            HAVANNO=havanno_special_info
+        sample_results[sample] = replace(
+            sample_results[sample], HAVANNO=havanno_special_info
         )
 
         all_results.update(sample_results)
@@ -60,14 +67,15 @@ def get_f8_inv_annotation(f8_json_path):
     and add annotation for the inversion
     """
     f8_inv_info = unpack_json(f8_json_path)
-    f8_inv_annotation = ""
     if f8_inv_info is None:
-        return f8_inv_annotation
-    if f8_inv_info["f8inv1"]["has_inversion"]:
-        f8_inv_annotation += "{},".format(f8_inv_info["f8inv1"]["inversion_genotype"])
-    if f8_inv_info["f8inv22"]["has_inversion"]:
-        f8_inv_annotation += "{},".format(f8_inv_info["f8inv22"]["inversion_genotype"])
-    return f8_inv_annotation
+        return ""
+    genotypes = [
+        str(f8_inv_info[inversion]["inversion_genotype"])
+        for inversion in ("f8inv1", "f8inv22")
+        if f8_inv_info[inversion]["has_inversion"]
+    ]
+    # keep the historical trailing comma on non-empty annotations
+    return ",".join(genotypes) + ("," if genotypes else "")
 
 
 def get_havanno_annotations(havanno_json_path):
@@ -81,32 +89,32 @@ def get_havanno_annotations(havanno_json_path):
     if havanno_info is None:
         return results
 
-    for region in havanno_info["annotations"]:
+    for region, region_annotations in havanno_info["annotations"].items():
         region_havanno_annotations = []
-        for haplotype in havanno_info["annotations"][region]:
+        for haplotype, annotation in region_annotations.items():
             if "hba_homology" in haplotype:
                 continue
-            annotation = havanno_info["annotations"][region][haplotype]
-            pathogenic_variant_count = annotation["num_pathogenic_variants"]
-            insertion_size = annotation["total_insertion_size"]
-            deletion_size = annotation["total_deletion_size"]
+            pathogenic_variant_count = annotation["num_pathogenic_variants"] or 0
+            insertion_size = annotation["total_insertion_size"] or 0
+            deletion_size = annotation["total_deletion_size"] or 0
 
-            haplotype_annotations = []
+            # most haplotypes are wild-type; skip the string building
+            # unless at least one metric is non-zero
+            if not (pathogenic_variant_count or insertion_size or deletion_size):
+                continue
 
-            if pathogenic_variant_count and pathogenic_variant_count > 0:
+            haplotype_annotations = []
+            if pathogenic_variant_count > 0:
                 haplotype_annotations.append(
                     f"{pathogenic_variant_count} possible pathogenic vars"
                 )
-
-            if insertion_size and insertion_size > 0:
+            if insertion_size > 0:
                 haplotype_annotations.append(f"{insertion_size}bp INS")
-
-            if deletion_size and deletion_size > 0:
+            if deletion_size > 0:
                 haplotype_annotations.append(f"{deletion_size}bp DEL")
             if len(haplotype_annotations) > 0:
-                haplotype_annotations = ", ".join(haplotype_annotations)
                 region_havanno_annotations.append(
-                    f"{haplotype},{haplotype_annotations}"
+                    f"{haplotype},{', '.join(haplotype_annotations)}"
                 )
         if len(region_havanno_annotations) > 0:
             results[region] = ";".join(region_havanno_annotations)
@@ -46,6 +46,44 @@ def define_special_fields():
     return cmrg_special_fields
 
 
+# flattened once at import so the per-region hot path doesn't rebuild
+# and re-sort the field set for every (sample, region) pair
+CMRG_SPECIAL_FIELDS = define_special_fields()
+SPECIAL_FIELD_NAMES = tuple(
+    sorted({str(x) for x in chain(*CMRG_SPECIAL_FIELDS.values())})
+)
+
+
+def _format_special_field(field):
+    """
+    Render one entry of a list-valued special info field
+    """
+    if isinstance(field, list):
+        return " | ".join(str(x) for x in field)
+    return str(field)
+
+
+def _fmt_list(field_name, field_data):
+    if len(field_data) == 0:
+        return None
+    field_joined = ", ".join(_format_special_field(field) for field in field_data)
+    return f"{field_name}: {field_joined}"
+
+
+def _fmt_dict(field_name, field_data):
+    if len(field_data) == 0:
+        return None
+    return "{},{}".format(field_name, ", ".join("{}".format(key) for key in field_data))
+
+
+def _fmt_scalar(field_name, field_data):
+    return "{},{}".format(field_name, field_data)
+
+
+# formatters for special info fields, keyed by the field value's type
+_FMT_DISPATCH = {list: _fmt_list, dict: _fmt_dict}
+
+
 def get_special_info(
     region_name: str, region_data: Dict, paraphase_results: ParaphaseResults
 ):
@@ -53,50 +91,22 @@ def get_special_info(
     Get total_cn field and special info field for complex medically-relevant genes
     """
     total_cn = get_copy_number(region_data)
-    cmrg_special_fields = define_special_fields()
     special_info = []
 
-    for special_field_name in sorted(
-        set([str(x) for x in chain(*cmrg_special_fields.values())])
-    ):
+    # f8 regions only report the inversion call,
+    # so skip the special-field scan entirely
+    is_f8 = "f8" in region_name.lower()
+    for special_field_name in SPECIAL_FIELD_NAMES if not is_f8 else ():
         if special_field_name in region_data:
             special_info_field_data = region_data[special_field_name]
             if special_info_field_data is None or special_info_field_data == "NA":
                 continue
 
-            if type(special_info_field_data) is list:
-                if len(special_info_field_data) == 0:
-                    continue
-                field_joined = ""
-                for field in special_info_field_data:
-                    if len(field_joined) > 0:
-                        field_joined += ", "
-                    if type(field) is list:
-                        field_joined += " | ".join(str(x) for x in field)
-                    else:
-                        field_joined += field
-
-                special_info.append(f"{special_field_name}: {field_joined}")
-            elif type(special_info_field_data) is dict:
-                if len(special_info_field_data) == 0:
-                    continue
-                # append dict data
-                special_info_items = []
-                for key in special_info_field_data:
-                    special_info_items.append("{}".format(key))
-                special_info.append(
-                    "{},{}".format(special_field_name, ", ".join(special_info_items))
-                )
-            else:
-                # append string data
-                special_info.append(
-                    "{},{}".format(special_field_name, special_info_field_data)
-                )
-
-    # if this is f8, drop everything other than the inversion call
-    is_f8 = "f8" in region_name.lower()
-    if is_f8:
-        special_info = []
+            formatter = _FMT_DISPATCH.get(type(special_info_field_data), _fmt_scalar)
+            fragment = formatter(special_field_name, special_info_field_data)
+            if fragment:
+                special_info.append(fragment)
+
     if paraphase_results.F8_INV:
         special_info.append(paraphase_results.F8_INV)
     elif (
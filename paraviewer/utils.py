@@ -1,82 +1,133 @@
 #!/usr/bin/env python
 
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import cache, lru_cache
+import os
 from os import path, makedirs
 import pathlib
+import re
+import stat
 import shutil
 import sys
-import json
 from typing import Optional
-from cachetools import LRUCache
 import pysam
 import yaml
+
+# the libyaml-backed loader parses the region configs an order of
+# magnitude faster than the pure-Python fallback, where available
+try:
+    from yaml import CSafeLoader as YamlSafeLoader
+except ImportError:
+    from yaml import SafeLoader as YamlSafeLoader
 import gzip
 import logging
 from collections import namedtuple
 
+# orjson parses the large paraphase JSONs several times faster than the
+# stdlib; fall back to the stdlib when the optional dependency is absent
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+# isal's igzip is a drop-in gzip replacement with a much faster inflate;
+# same optional-dependency treatment as orjson above
+try:
+    from isal import igzip as gzip_impl
+except ImportError:
+    gzip_impl = gzip
+
 logger = logging.getLogger(__name__)
 
 REGION_PADDING = 1000
 
-# Define all namedtuples at module level
-RegionEntry = namedtuple(
-    "RegionEntry",
-    [
-        "Chrom",
-        "Start",
-        "End",
-        "Region",
-        "Sample",
-        "BAM",
-        "BAI",
-        "CopyNumber",
-        "SpecialInfo",
-        "Image",
-        "IGVSession",
-        "FamilyID",
-        "PaternalID",
-        "MaternalID",
-        "Sex",
-        "Phenotype",
-    ],
-)
-PedigreeEntry = namedtuple(
-    "PedigreeEntry",
-    ["FamilyID", "IndividualID", "PaternalID", "MaternalID", "Sex", "Phenotype"],
-)
-ParaphaseResults = namedtuple(
-    "ParaphaseResults", ["Sample", "BAM", "BAI", "JSON", "F8_INV", "HAVANNO"]
-)
-HAVANNO_INFO = namedtuple(
-    "HAVANNO_INFO", ["Haplotype", "PathogenicVariants", "Insertion", "Deletion"]
-)
-GenomicInterval = namedtuple("GenomicInterval", ["Chrom", "Start", "End"])
+# Define all record types at module level. Slotted frozen dataclasses
+# keep the namedtuple ergonomics (positional construction, immutable,
+# hashable) while storing fields in slot arrays, which trims per-row
+# memory and speeds attribute access for the large RegionEntry tables
+
+
+@dataclass(slots=True, frozen=True)
+class RegionEntry:
+    Chrom: str
+    Start: int
+    End: int
+    Region: str
+    Sample: str
+    BAM: str | list
+    BAI: str | list
+    CopyNumber: int | str
+    SpecialInfo: str
+    Image: str
+    IGVSession: str
+    FamilyID: str
+    PaternalID: str
+    MaternalID: str
+    Sex: str
+    Phenotype: str
+
+
+@dataclass(slots=True, frozen=True)
+class PedigreeEntry:
+    FamilyID: str
+    IndividualID: str
+    PaternalID: str
+    MaternalID: str
+    Sex: str
+    Phenotype: str
+
+
+@dataclass(slots=True, frozen=True)
+class ParaphaseResults:
+    Sample: str
+    BAM: str
+    BAI: str
+    JSON: str
+    F8_INV: str
+    HAVANNO: str | dict
+
+
+@dataclass(slots=True, frozen=True)
+class HAVANNO_INFO:
+    Haplotype: str
+    PathogenicVariants: int
+    Insertion: int
+    Deletion: int
+
+
+@dataclass(slots=True, frozen=True)
+class GenomicInterval:
+    Chrom: str
+    Start: int
+    End: int
 
 IMAGES_PATH = "data/{sample}/images"
 IGV_SESSIONS_PATH = "data/{sample}/igv_sessions"
 BAMS_PATH = "data/{sample}/bams"
 
+# one compiled match per region string instead of strip/split/replace
+# chains; the digit classes also reject negatives and stray text
+REGION_STR_RE = re.compile(r"\s*([^:\s]+):([\d,]+)-([\d,]+)\s*$")
+COMMA_TRANSLATION = str.maketrans("", "", ",")
 
+
+@lru_cache(maxsize=None)
 def genomic_interval_from_str(region_str):
     """
-    Given a string with a coordinate, return the coordinate as a GenomicInterval
+    Given a string with a coordinate, return the coordinate as a GenomicInterval.
+    Cached because the same config realign regions are parsed for every sample.
     """
-    try:
-        chrom_part, pos_part = region_str.strip().split(":")
-        start_str, end_str = pos_part.split("-")
-        start = int(start_str.replace(",", ""))
-        end = int(end_str.replace(",", ""))
-
-        if start < 0 or end < 0:
-            raise ValueError("Coordinates must be non-negative.")
-
-        return GenomicInterval(chrom_part, start, end)
-
-    except ValueError as e:
-        raise ValueError(f"Invalid region format or values: {e}")
-    except Exception:
+    match = REGION_STR_RE.match(region_str)
+    if match is None:
         raise ValueError(
             "Input must be in the format 'chrN:start-end' with numeric coordinates."
         )
+    return GenomicInterval(
+        match.group(1),
+        int(match.group(2).translate(COMMA_TRANSLATION)),
+        int(match.group(3).translate(COMMA_TRANSLATION)),
+    )
 
 
 def is_gzipped(putative_zipfile):
@@ -88,37 +139,51 @@ def is_gzipped(putative_zipfile):
         return id_bytes == b"\x1f\x8b"
 
 
+@lru_cache(maxsize=256)
 def unpack_json(json_filename):
     """
-    unpacks a json or json.gz file into a dict and returns it
+    unpacks a json or json.gz file into a dict and returns it.
+    Parsed results are cached by path, since trio building re-reads
+    the same sample and parent JSONs that were already parsed for
+    their individual table entries.
     """
-    if not (path.exists(json_filename) and path.isfile(json_filename)):
+    # one stat answers both existence and regular-file checks
+    try:
+        file_stat = os.stat(json_filename)
+    except OSError:
+        file_stat = None
+    if file_stat is None or not stat.S_ISREG(file_stat.st_mode):
         logger.warning(" {} does not exist".format(json_filename))
         return
-    if json_filename.endswith(".gz"):
-        if not is_gzipped(json_filename):
-            logger.warning(
-                "{} is identified as gzipped but is not".format(json_filename)
-            )
-            return
-        with gzip.open(json_filename, "rt", encoding="UTF-8") as json_fh:
-            try:
-                return json.load(json_fh)
-            except json.decoder.JSONDecodeError:
-                logger.warning(" {} is empty or misformatted".format(json_filename))
-                return
-    else:
-        with open(json_filename, "r") as json_fh:
-            try:
-                return json.load(json_fh)
-            except json.decoder.JSONDecodeError:
-                logger.warning(" {} is empty or misformatted".format(json_filename))
+    # one open serves both the gzip magic-byte sniff and the read: peek
+    # the first two bytes from the buffer, then either wrap the same
+    # handle in a decompressor or slurp it as-is. The 1 MB buffer keeps
+    # the sequential read from being chopped into default-sized syscalls
+    with open(json_filename, "rb", buffering=1 << 20) as json_fh:
+        if json_fh.peek(2)[:2] == b"\x1f\x8b":
+            with gzip_impl.open(json_fh, "rb") as gz_fh:
+                json_bytes = gz_fh.read()
+        else:
+            if json_filename.endswith(".gz"):
+                logger.warning(
+                    "{} is identified as gzipped but is not".format(json_filename)
+                )
                 return
+            json_bytes = json_fh.read()
+    try:
+        return json_loads(json_bytes)
+    # ValueError covers both orjson.JSONDecodeError and json.JSONDecodeError
+    except ValueError:
+        logger.warning(" {} is empty or misformatted".format(json_filename))
+        return
 
 
+@cache
 def get_config(genome_build, source_pipeline):
     """
     Read region config files and return as a dictionary.
+    Results are cached per (genome_build, source_pipeline) so repeat
+    lookups skip the file read and YAML parse.
 
     Args:
         genome_build (str): The genome build identifier (e.g., 'hg38', 'hg19')
@@ -139,7 +204,7 @@ def get_config(genome_build, source_pipeline):
 
     try:
         with open(config_path, "r") as f:
-            config_data = yaml.safe_load(f)
+            config_data = yaml.load(f, Loader=YamlSafeLoader)
         return config_data
     except yaml.YAMLError as e:
         logger.error(f"Error parsing YAML file {config_path}: {e}")
@@ -154,9 +219,12 @@ def is_linux():
     return sys.platform.startswith("linux")
 
 
+@lru_cache(maxsize=4096)
 def parse_sample_name_from_paraphase_output(file_path):
     """
-    Parse a sample name from a paraphase output file
+    Parse a sample name from a paraphase output file.
+    Cached because each sample's name is re-derived from several of its
+    output files during directory scans.
     """
     base_name = path.basename(file_path)
     file_name, ext = path.splitext(base_name)
@@ -175,11 +243,12 @@ def make_output_dirs(
     If already exists and clobber is not set, exit.
     """
     data_dir = path.join(outdir, "data")
-    if path == pathlib.Path("/") or path == pathlib.Path.home():
+    outdir_abs = path.realpath(outdir)
+    if outdir_abs in ("/", path.expanduser("~")):
         logger.error(
             "For safety reasons, Paraviewer cannot output to root or home directories (`/` or $HOME)"
         )
-        sys.exit()
+        sys.exit(1)
 
     if path.exists(data_dir) and not clobber:
         logger.error(
@@ -197,6 +266,25 @@ def make_output_dirs(
             makedirs(new_path, exist_ok=True)
 
 
+def _copy_file(src, dst):
+    """
+    Copy a file with an in-kernel os.sendfile loop, falling back to
+    shutil.copy where sendfile is unavailable or refuses the files.
+    """
+    try:
+        with open(src, "rb") as src_fh, open(dst, "wb") as dst_fh:
+            src_fd = src_fh.fileno()
+            dst_fd = dst_fh.fileno()
+            offset = 0
+            while True:
+                sent = os.sendfile(dst_fd, src_fd, offset, 1 << 20)
+                if sent == 0:
+                    break
+                offset += sent
+    except (AttributeError, OSError):
+        shutil.copy(src, dst)
+
+
 def copy_trio_bams(
     trio,
     region,
@@ -206,10 +294,14 @@ def copy_trio_bams(
     maternal_bam,
 ):
     bams = []
-    new_bam_pattern = new_target_bam = path.join(
+    bais = []
+    new_bam_pattern = path.join(
         BAMS_PATH.format(sample=trio.IndividualID + "-trio"),
         "{}_{}.bam",
     )
+    # build the copy list first so the returned BAM/BAI ordering is
+    # unaffected by the order the copies finish in
+    copy_pairs = []
     for sample, bam in (
         (trio.PaternalID, paternal_bam),
         (trio.MaternalID, maternal_bam),
@@ -217,15 +309,20 @@ def copy_trio_bams(
     ):
         bam = path.join(outdir, bam)
         bai = bam + ".bai"
-        new_target_bam = path.join(new_bam_pattern.format(sample, region))
+        new_target_bam = new_bam_pattern.format(sample, region)
         new_target_bai = new_target_bam + ".bai"
 
-        shutil.copy(bam, path.join(outdir, new_target_bam))
-        shutil.copy(bai, path.join(outdir, new_target_bai))
+        copy_pairs.append((bam, path.join(outdir, new_target_bam)))
+        copy_pairs.append((bai, path.join(outdir, new_target_bai)))
 
         bams.append(new_target_bam)
+        bais.append(new_target_bai)
 
-    return bams
+    # the six copies are independent and kernel-bound, so overlap them
+    with ThreadPoolExecutor(max_workers=len(copy_pairs)) as executor:
+        list(executor.map(lambda pair: _copy_file(*pair), copy_pairs))
+
+    return bams, bais
 
 
 def split_bam(
@@ -236,6 +333,7 @@ def split_bam(
     include_only_regions: Optional[str],
     exclude_regions: Optional[str],
     max_reads_per_hap: int,
+    num_threads: int = 1,
 ) -> dict:
     """
     Split a BAM file into smaller chunks based on RN tags for improved IGV visualization.
@@ -246,78 +344,140 @@ def split_bam(
         bai_path: Path to the input BAI file
         outdir: Output directory path
         sample: Sample ID
+        num_threads: htslib threads for BGZF decompression of the input.
+            Reads are routed by RN tag in a single pass, so threading the
+            (de)compression is the parallelism available here.
 
     Returns:
         Dictionary mapping region names to namedtuples containing BAM and BAI paths
     """
-    # Create an LRU cache for file handles with max size of 5
-    region_files_cache = LRUCache(maxsize=5)
     region_bam_paths = namedtuple("RegionBamPaths", ["BAM", "BAI"])
     result_abs_paths = {}
     result_relative_paths = {}
     new_bam_pattern = path.join(BAMS_PATH.format(sample=sample), "{}_{}.bam")
+    # normalize the filters once so the per-read membership tests are
+    # O(1) set lookups against pre-lowercased names
+    include_set = (
+        frozenset(x.lower() for x in include_only_regions)
+        if include_only_regions
+        else None
+    )
+    exclude_set = (
+        frozenset(x.lower() for x in exclude_regions) if exclude_regions else None
+    )
 
+    # the whole BAM is streamed front to back, so ask the kernel to start
+    # pulling it into the page cache; pysam does not expose the htslib fd,
+    # so the advice goes through a short-lived descriptor (the readahead
+    # it triggers is per-file, not per-descriptor). Best-effort only.
     try:
-        with pysam.AlignmentFile(bam_path, "rb") as in_bam:
-            # Create a new simplified header
-            new_header = pysam.AlignmentHeader.from_dict(
-                {"HD": in_bam.header["HD"], "SQ": in_bam.header["SQ"]}
-            )
-            haplotype_read_counts = {}
-            for read in in_bam:
-                if not read.has_tag("RN"):
-                    continue
-
+        advise_fd = os.open(bam_path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(advise_fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(advise_fd)
+    except (AttributeError, OSError):
+        pass
+
+    # first pass: bucket the passing reads per region. Holding the
+    # selected reads in memory is bounded by max_reads_per_hap, and it
+    # lets every region BAM be written in one contiguous burst with a
+    # single open/close instead of thrashing interleaved writer handles
+    region_read_buffers = {}
+    haplotype_read_counts = {}
+    # haplotypes that already hit max_reads_per_hap; one set lookup
+    # replaces the count-and-compare for the rest of their reads
+    full_haplotypes = set()
+    with pysam.AlignmentFile(bam_path, "rb", threads=max(num_threads, 1)) as in_bam:
+        # Create a new simplified header
+        new_header = pysam.AlignmentHeader.from_dict(
+            {"HD": in_bam.header["HD"], "SQ": in_bam.header["SQ"]}
+        )
+        for read in in_bam:
+            # one get_tag per tag; has_tag would double the C calls in
+            # this loop and untagged reads are the exception, not the rule
+            try:
                 region_name = read.get_tag("RN")
-                if (
-                    include_only_regions
-                    and region_name.lower() not in include_only_regions
-                ):
+            except KeyError:
+                continue
+            if include_set is not None or exclude_set is not None:
+                region_name_lower = region_name.lower()
+                if include_set is not None and region_name_lower not in include_set:
                     continue
-                if exclude_regions and region_name.lower() in exclude_regions:
+                if exclude_set is not None and region_name_lower in exclude_set:
                     continue
 
+            try:
+                hp = read.get_tag("HP")
+            except KeyError:
                 hp = "unknown"
-                if read.has_tag("HP"):
-                    hp = read.get_tag("HP")
 
-                if hp and hp not in haplotype_read_counts:
-                    haplotype_read_counts[hp] = 0
-                if hp and haplotype_read_counts[hp] >= max_reads_per_hap:
+            if hp:
+                if hp in full_haplotypes:
                     continue
-
-                # If we haven't created a file for this region yet, create it
-                if region_name not in region_files_cache:
-                    bam_out_path = path.join(
-                        outdir,
-                        new_bam_pattern.format(sample, region_name),
-                    )
-                    region_files_cache[region_name] = pysam.AlignmentFile(
-                        bam_out_path, "wb", header=new_header, index_filename=bai_path
-                    )
-                    result_abs_paths[region_name] = bam_out_path
-
-                region_files_cache[region_name].write(read)
-                if hp:
-                    haplotype_read_counts[hp] += 1
-            for hap in haplotype_read_counts:
-                logger.debug(
-                    "{} haplotype {}: {} reads".format(
-                        sample, hap, haplotype_read_counts[hap]
-                    )
+                hp_count = haplotype_read_counts.get(hp, 0)
+                if hp_count >= max_reads_per_hap:
+                    full_haplotypes.add(hp)
+                    continue
+                haplotype_read_counts[hp] = hp_count + 1
+
+            if region_name not in region_read_buffers:
+                region_read_buffers[region_name] = []
+            region_read_buffers[region_name].append(read)
+        for hap in haplotype_read_counts:
+            logger.debug(
+                "{} haplotype {}: {} reads".format(
+                    sample, hap, haplotype_read_counts[hap]
                 )
+            )
 
-    finally:
-        for file_handle in region_files_cache.values():
-            if file_handle is not None:
-                file_handle.close()
-
-        for region_name, bam_path in result_abs_paths.items():
-            pysam.index(bam_path)
-            result_relative_paths[region_name] = region_bam_paths(
-                BAM=new_bam_pattern.format(sample, region_name),
-                BAI=new_bam_pattern.format(sample, region_name) + ".bai",
+    # second pass: write each region's reads in one burst. The regions
+    # are independent files and pysam releases the GIL for the BGZF
+    # work, so the bursts run in a thread pool (worker processes would
+    # require pickling every AlignedSegment across the boundary)
+    def write_region_bam(region_name):
+        bam_out_path = path.join(
+            outdir,
+            new_bam_pattern.format(sample, region_name),
+        )
+        # two htslib threads per writer keep BGZF encoding off the loop
+        with pysam.AlignmentFile(
+            bam_out_path,
+            "wb",
+            header=new_header,
+            index_filename=bai_path,
+            threads=2,
+        ) as out_bam:
+            for read in region_read_buffers[region_name]:
+                out_bam.write(read)
+        return bam_out_path
+
+    if region_read_buffers:
+        with ThreadPoolExecutor(
+            max_workers=min(8, len(region_read_buffers))
+        ) as executor:
+            for region_name, bam_out_path in zip(
+                region_read_buffers,
+                executor.map(write_region_bam, region_read_buffers),
+            ):
+                result_abs_paths[region_name] = bam_out_path
+
+    # each index writes a distinct .bai, so the per-region calls can
+    # run concurrently; htslib releases the GIL while indexing
+    if result_abs_paths:
+        with ThreadPoolExecutor(max_workers=min(8, len(result_abs_paths))) as executor:
+            list(
+                executor.map(
+                    lambda out_path: pysam.index("-@", "2", out_path),
+                    result_abs_paths.values(),
+                )
             )
+    for region_name in result_abs_paths:
+        relative_bam = new_bam_pattern.format(sample, region_name)
+        result_relative_paths[region_name] = region_bam_paths(
+            BAM=relative_bam,
+            BAI=relative_bam + ".bai",
+        )
     return result_relative_paths
 
 